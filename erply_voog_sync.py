@@ -1,18 +1,51 @@
+import asyncio
+import copy
 import json
 import os
 import sys
+import threading
+import time
+from collections import defaultdict
 from typing import Any, Dict, List, Optional, Tuple
 
+import aiohttp
+import orjson
 import requests
 import typer
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import uvicorn
 
+try:
+    import ijson
+except ImportError:  # streaming parse is an optional speedup
+    ijson = None
+
 
 app = typer.Typer(help="Erply ↔ Voog stock sync POC. Looks up SKU in Erply, sums stock, updates Voog product stock.")
 
+# One knob bounds concurrency everywhere: the adapter pool, the aiohttp
+# connector and the write semaphore must be sized together, otherwise bursts
+# overflow the pool and pay fresh TLS handshakes.
+CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "16"))
+
+# Shared HTTP session for the synchronous CLI path: keeps TCP+TLS connections
+# alive across the sequential Erply/Voog calls and retries transient errors.
+_SESSION = requests.Session()
+_SESSION.headers.update({"User-Agent": "voog-erply-sync/0.1"})
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=CONCURRENCY,
+        pool_maxsize=CONCURRENCY * 2,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+    ),
+)
+
 
 class SyncConfig:
     def __init__(
@@ -47,35 +80,81 @@ def log(message: str, verbose: bool) -> None:
         typer.echo(message)
 
 
+class ErplyApiError(RuntimeError):
+    """Erply API returned a non-zero errorCode."""
+
+    def __init__(self, message: str, error_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.error_code = error_code
+
+
 def erply_api_request(
     url: str,
     payload: Dict[str, Any],
     timeout_seconds: int,
     verbose: bool = False,
 ) -> Dict[str, Any]:
-    headers = {"User-Agent": "voog-erply-sync/0.1"}
     log(
         f"POST {url} payload={json.dumps({k: v for k, v in payload.items() if k not in ['username', 'password', 'sessionKey']})}",
         verbose,
     )
-    response = requests.post(url, data=payload, headers=headers, timeout=timeout_seconds)
+    response = _SESSION.post(url, data=payload, timeout=timeout_seconds)
     response.raise_for_status()
-    data = response.json()
+    data = orjson.loads(response.content)
     status = data.get("status", {})
     error_code = status.get("errorCode")
     if error_code not in (None, 0):
-        raise RuntimeError(f"Erply API error: code={error_code} msg={status.get('errorField') or status}")
+        raise ErplyApiError(
+            f"Erply API error: code={error_code} msg={status.get('errorField') or status}",
+            error_code=error_code,
+        )
     return data
 
 
-def erply_get_session_key(cfg: SyncConfig) -> str:
-    payload = {
-        "clientCode": cfg.erply_client_code,
-        "request": "verifyUser",
-        "username": cfg.erply_username,
-        "password": cfg.erply_password,
-    }
-    data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
+def erply_api_request_stream(
+    url: str,
+    payload: Dict[str, Any],
+    timeout_seconds: int,
+    handle_record,
+    verbose: bool = False,
+) -> None:
+    """POST to Erply and feed each records[] item to handle_record as it is parsed.
+
+    Keeps peak memory flat for responses listing thousands of products instead
+    of materializing the whole JSON body first. Falls back to the buffered
+    erply_api_request when ijson is not installed.
+    """
+    if ijson is None:
+        data = erply_api_request(url, payload, timeout_seconds, verbose)
+        for rec in data.get("records") or []:
+            handle_record(rec)
+        return
+
+    log(
+        f"POST {url} payload={json.dumps({k: v for k, v in payload.items() if k not in ['username', 'password', 'sessionKey']})}",
+        verbose,
+    )
+    response = _SESSION.post(url, data=payload, timeout=timeout_seconds, stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    error_code = None
+    builder = None
+    for prefix, event, value in ijson.parse(response.raw):
+        if prefix == "status.errorCode":
+            error_code = value
+        elif prefix == "records.item" and event == "start_map":
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif builder is not None and prefix.startswith("records.item"):
+            builder.event(event, value)
+            if prefix == "records.item" and event == "end_map":
+                handle_record(builder.value)
+                builder = None
+    if error_code not in (None, 0):
+        raise ErplyApiError(f"Erply API error: code={error_code}", error_code=error_code)
+
+
+def _extract_session_key(data: Dict[str, Any]) -> str:
     # Response usually includes records: [{"sessionKey": "..."}] or top-level sessionKey
     records = data.get("records") or []
     if records and isinstance(records, list):
@@ -88,16 +167,61 @@ def erply_get_session_key(cfg: SyncConfig) -> str:
     raise RuntimeError("Could not obtain Erply sessionKey from response")
 
 
-def erply_find_product_ids_by_sku(cfg: SyncConfig, session_key: str, sku: str) -> List[int]:
-    payload = {
+def _verify_user_payload(cfg: SyncConfig) -> Dict[str, Any]:
+    return {
         "clientCode": cfg.erply_client_code,
-        "request": "getProducts",
+        "request": "verifyUser",
+        "username": cfg.erply_username,
+        "password": cfg.erply_password,
+    }
+
+
+def _erply_payload(cfg: SyncConfig, session_key: str, request_name: str, **fields: Any) -> Dict[str, Any]:
+    """Build an Erply payload on the shared clientCode/sessionKey base."""
+    payload: Dict[str, Any] = {
+        "clientCode": cfg.erply_client_code,
+        "request": request_name,
         "sessionKey": session_key,
-        # Try typical code fields; Erply supports multiple code fields
-        "code": sku,
     }
-    data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
-    records = data.get("records") or []
+    payload.update(fields)
+    return payload
+
+
+def erply_get_session_key(cfg: SyncConfig) -> str:
+    data = erply_api_request(cfg.erply_api_url, _verify_user_payload(cfg), cfg.timeout_seconds, cfg.verbose)
+    return _extract_session_key(data)
+
+
+# Erply session keys stay valid for about an hour; cache them per account so
+# webhook bursts do not pay an extra verifyUser round trip each time.
+_ERPLY_SESSION_TTL_SECONDS = 3600
+_ERPLY_SESSION_EXPIRED_CODES = {1054, 1055}
+_ERPLY_SESSION_CACHE: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_ERPLY_SESSION_LOCK = threading.Lock()
+
+
+def _is_expired_session_error(exc: BaseException) -> bool:
+    return isinstance(exc, ErplyApiError) and exc.error_code in _ERPLY_SESSION_EXPIRED_CODES
+
+
+def get_cached_session_key(cfg: SyncConfig) -> str:
+    cache_key = (cfg.erply_client_code, cfg.erply_username)
+    with _ERPLY_SESSION_LOCK:
+        entry = _ERPLY_SESSION_CACHE.get(cache_key)
+        if entry and time.time() < entry[1] - 60:
+            return entry[0]
+    session_key = erply_get_session_key(cfg)
+    with _ERPLY_SESSION_LOCK:
+        _ERPLY_SESSION_CACHE[cache_key] = (session_key, time.time() + _ERPLY_SESSION_TTL_SECONDS)
+    return session_key
+
+
+def invalidate_session_key(cfg: SyncConfig) -> None:
+    with _ERPLY_SESSION_LOCK:
+        _ERPLY_SESSION_CACHE.pop((cfg.erply_client_code, cfg.erply_username), None)
+
+
+def _product_ids_from_records(records: List[Dict[str, Any]], sku: str) -> List[int]:
     product_ids: List[int] = []
     for rec in records:
         product_id = rec.get("productID") or rec.get("id")
@@ -107,76 +231,126 @@ def erply_find_product_ids_by_sku(cfg: SyncConfig, session_key: str, sku: str) -
     return product_ids
 
 
+def erply_find_product_ids_by_sku(cfg: SyncConfig, session_key: str, sku: str) -> List[int]:
+    # Try typical code fields; Erply supports multiple code fields
+    payload = _erply_payload(cfg, session_key, "getProducts", code=sku)
+    data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
+    return _product_ids_from_records(data.get("records") or [], sku)
+
+
+def _stock_payload(cfg: SyncConfig, session_key: str, product_ids: List[int]) -> Dict[str, Any]:
+    ids_csv = ",".join(str(pid) for pid in product_ids)
+    payload = _erply_payload(cfg, session_key, "getProductStock", productIDs=ids_csv)
+    if cfg.erply_warehouse_id and not cfg.sum_all_warehouses:
+        payload["warehouseID"] = cfg.erply_warehouse_id
+    return payload
+
+
+def _accumulate_stock_record(cfg: SyncConfig, rec: Dict[str, Any], stock_per_product: Dict[int, float]) -> None:
+    product_id = int(rec.get("productID") or rec.get("id"))
+    # Try fields commonly seen: free, amount, total
+    amount = rec.get("free")
+    if amount is None:
+        amount = rec.get("amount")
+    if amount is None:
+        amount = rec.get("total")
+    if amount is None:
+        amount = rec.get("amountInStock")
+    try:
+        amount_float = float(amount or 0)
+    except Exception:
+        amount_float = 0.0
+    if cfg.sum_all_warehouses or cfg.erply_warehouse_id is None:
+        stock_per_product[product_id] += amount_float
+    else:
+        # When a warehouseID filter is sent, each record should already be that warehouse
+        stock_per_product[product_id] = amount_float
+
+
+def _stock_map_from_records(cfg: SyncConfig, records: List[Dict[str, Any]]) -> Dict[int, float]:
+    stock_per_product: Dict[int, float] = defaultdict(float)
+    for rec in records:
+        _accumulate_stock_record(cfg, rec, stock_per_product)
+    return stock_per_product
+
+
 def erply_get_stock_for_products(
     cfg: SyncConfig, session_key: str, product_ids: List[int]
 ) -> Dict[int, float]:
     if not product_ids:
         return {}
-    ids_csv = ",".join(str(pid) for pid in product_ids)
-    payload: Dict[str, Any] = {
-        "clientCode": cfg.erply_client_code,
-        "request": "getProductStock",
-        "sessionKey": session_key,
-        "productIDs": ids_csv,
-    }
-    if cfg.erply_warehouse_id and not cfg.sum_all_warehouses:
-        payload["warehouseID"] = cfg.erply_warehouse_id
-    data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
-    records = data.get("records") or []
-    stock_per_product: Dict[int, float] = {}
-    for rec in records:
-        product_id = int(rec.get("productID") or rec.get("id"))
-        # Try fields commonly seen: free, amount, total
-        amount = rec.get("free")
-        if amount is None:
-            amount = rec.get("amount")
-        if amount is None:
-            amount = rec.get("total")
-        if amount is None:
-            amount = rec.get("amountInStock")
-        try:
-            amount_float = float(amount or 0)
-        except Exception:
-            amount_float = 0.0
-        if cfg.sum_all_warehouses or cfg.erply_warehouse_id is None:
-            stock_per_product[product_id] = stock_per_product.get(product_id, 0.0) + amount_float
-        else:
-            # When a warehouseID filter is sent, each record should already be that warehouse
-            stock_per_product[product_id] = amount_float
+    payload = _stock_payload(cfg, session_key, product_ids)
+    stock_per_product: Dict[int, float] = defaultdict(float)
+    erply_api_request_stream(
+        cfg.erply_api_url,
+        payload,
+        cfg.timeout_seconds,
+        lambda rec: _accumulate_stock_record(cfg, rec, stock_per_product),
+        cfg.verbose,
+    )
     return stock_per_product
 
 
+# Warehouses, product groups and VAT rates are near-static reference data;
+# cache the picked defaults per client so batch operations do not re-fetch them.
+# Each kind carries a version counter ("bump version on write"): bumping it
+# makes every existing entry of that kind unreachable without scanning the
+# cache, so an Erply admin change can invalidate instantly instead of waiting
+# out the TTL.
+_REF_CACHE_TTL_SECONDS = 300
+_REF_KINDS = ("warehouse", "group", "vat_rate")
+_REF_CACHE: Dict[Tuple[str, str, int], Tuple[float, int]] = {}
+_REF_VERSION: Dict[str, int] = defaultdict(int)
+
+
+def _ref_cache_get(kind: str, client_code: str) -> Optional[int]:
+    entry = _REF_CACHE.get((kind, client_code, _REF_VERSION[kind]))
+    if entry and time.time() - entry[0] < _REF_CACHE_TTL_SECONDS:
+        return entry[1]
+    return None
+
+
+def _ref_cache_put(kind: str, client_code: str, value: int) -> None:
+    _REF_CACHE[(kind, client_code, _REF_VERSION[kind])] = (time.time(), value)
+
+
+def bump_reference_version(kind: str) -> None:
+    """Force cache misses for one reference kind; stale keys age out via TTL."""
+    _REF_VERSION[kind] += 1
+
+
+def invalidate_reference_cache() -> None:
+    _REF_CACHE.clear()
+
+
 def erply_pick_default_warehouse(cfg: SyncConfig, session_key: str) -> int:
-    payload = {
-        "clientCode": cfg.erply_client_code,
-        "request": "getWarehouses",
-        "sessionKey": session_key,
-    }
+    cached = _ref_cache_get("warehouse", cfg.erply_client_code)
+    if cached is not None:
+        return cached
+    payload = _erply_payload(cfg, session_key, "getWarehouses")
     data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
     records = data.get("records") or []
-    if not records:
-        return 1
-    for w in records:
-        if w.get("active") in (True, 1, "1"):
-            wid = w.get("warehouseID") or w.get("id")
-            if wid:
-                return int(wid)
-    wid = records[0].get("warehouseID") or records[0].get("id")
-    return int(wid or 1)
+    wid = None
+    if records:
+        for w in records:
+            if w.get("active") in (True, 1, "1"):
+                wid = w.get("warehouseID") or w.get("id")
+                if wid:
+                    break
+        if not wid:
+            wid = records[0].get("warehouseID") or records[0].get("id")
+    result = int(wid or 1)
+    _ref_cache_put("warehouse", cfg.erply_client_code, result)
+    return result
 
 
 def erply_inventory_registration(
     cfg: SyncConfig, session_key: str, product_id: int, amount: float, warehouse_id: Optional[int]
 ) -> Dict[str, Any]:
     wid = warehouse_id or erply_pick_default_warehouse(cfg, session_key)
-    payload = {
-        "clientCode": cfg.erply_client_code,
-        "request": "saveInventoryRegistration",
-        "sessionKey": session_key,
-        "warehouseID": wid,
-        "productID1": product_id,
-        "amount1": amount,
-    }
+    payload = _erply_payload(
+        cfg, session_key, "saveInventoryRegistration", warehouseID=wid, productID1=product_id, amount1=amount
+    )
     return erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
 
 
@@ -184,18 +358,21 @@ def erply_inventory_writeoff(
     cfg: SyncConfig, session_key: str, product_id: int, amount: float, warehouse_id: Optional[int]
 ) -> Dict[str, Any]:
     wid = warehouse_id or erply_pick_default_warehouse(cfg, session_key)
-    payload = {
-        "clientCode": cfg.erply_client_code,
-        "request": "saveInventoryWriteOff",
-        "sessionKey": session_key,
-        "warehouseID": wid,
-        "reasonID": 1,
-        "productID1": product_id,
-        "amount1": amount,
-    }
+    payload = _erply_payload(
+        cfg, session_key, "saveInventoryWriteOff", warehouseID=wid, reasonID=1, productID1=product_id, amount1=amount
+    )
     return erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
 
 
+# Voog's REST layer supports HTTP caching: remember the ETag per SKU and replay
+# it with If-None-Match so unchanged products come back as a body-less 304.
+_VOOG_ETAG_CACHE: Dict[Tuple[str, str], Tuple[str, Optional[Dict[str, Any]]]] = {}
+
+
+def invalidate_voog_etag(voog_site: str, sku: str) -> None:
+    _VOOG_ETAG_CACHE.pop((voog_site, sku), None)
+
+
 def voog_get_product_by_sku(voog_site: str, api_token: str, sku: str, timeout_seconds: int, verbose: bool = False) -> Optional[Dict[str, Any]]:
     url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
     # Use documented filter syntax
@@ -203,21 +380,46 @@ def voog_get_product_by_sku(voog_site: str, api_token: str, sku: str, timeout_se
     headers = {
         "X-API-TOKEN": api_token,
         "Accept": "application/json",
-        "User-Agent": "voog-erply-sync/0.1",
     }
+    cached = _VOOG_ETAG_CACHE.get((voog_site, sku))
+    if cached:
+        headers["If-None-Match"] = cached[0]
     log(f"GET {url} params={params}", verbose)
-    resp = requests.get(url, headers=headers, params=params, timeout=timeout_seconds)
+    resp = _SESSION.get(url, headers=headers, params=params, timeout=timeout_seconds)
+    if cached and resp.status_code == 304:
+        log(f"304 for SKU {sku}; using cached product", verbose)
+        return cached[1]
     resp.raise_for_status()
-    items = resp.json()
+    items = orjson.loads(resp.content)
+    product: Optional[Dict[str, Any]] = None
     if isinstance(items, list) and items:
         # Expect exactly one item for exact SKU match
         for it in items:
             if it.get("sku") == sku:
-                return it
-    return None
+                product = it
+                break
+    etag = resp.headers.get("ETag")
+    if etag:
+        _VOOG_ETAG_CACHE[(voog_site, sku)] = (etag, product)
+    return product
+
+
+def _voog_stock_matches(voog_product: Dict[str, Any], stock_value: float) -> bool:
+    """True when the product dict already carries the target stock; lets callers skip the write."""
+    try:
+        current = float(voog_product.get("stock"))
+    except (TypeError, ValueError):
+        return False
+    return abs(current - stock_value) < 1e-9
 
 
 def voog_update_stock(voog_site: str, api_token: str, product_id: int, stock_value: float, timeout_seconds: int, verbose: bool = False) -> Dict[str, Any]:
+    headers = {
+        "X-API-TOKEN": api_token,
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
+
     url_bulk = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
     payload_bulk = {
         "actions": [
@@ -225,60 +427,35 @@ def voog_update_stock(voog_site: str, api_token: str, product_id: int, stock_val
         ],
         "target_ids": [product_id],
     }
-
-    header_variants = [
-        {"X-API-TOKEN": api_token},
-    ]
-
-    last_err: Optional[Exception] = None
-    for hv in header_variants:
-        headers = {
-            **hv,
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "User-Agent": "voog-erply-sync/0.1",
-        }
-        try:
-            log(f"PUT {url_bulk} payload={json.dumps(payload_bulk)} headers_variant={list(hv.keys())}", verbose)
-            resp = requests.put(url_bulk, headers=headers, data=json.dumps(payload_bulk), timeout=timeout_seconds)
-            if resp.status_code == 401:
-                last_err = requests.HTTPError(f"401 Unauthorized (variant {hv})")
-                continue
-            resp.raise_for_status()
-            return resp.json() if resp.content else {}
-        except Exception as e:
-            last_err = e
-            continue
+    try:
+        log(f"PUT {url_bulk} payload={json.dumps(payload_bulk)}", verbose)
+        resp = _SESSION.put(url_bulk, headers=headers, data=orjson.dumps(payload_bulk), timeout=timeout_seconds)
+        resp.raise_for_status()
+        return orjson.loads(resp.content) if resp.content else {}
+    except Exception as bulk_err:
+        last_err = bulk_err
 
     # Fallback: try PATCH single-product endpoint
     url_single = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products/{product_id}"
     payload_single = {"stock": stock_value}
-    for hv in header_variants:
-        headers = {
-            **hv,
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "User-Agent": "voog-erply-sync/0.1",
-        }
-        try:
-            log(f"PATCH {url_single} payload={json.dumps(payload_single)} headers_variant={list(hv.keys())}", verbose)
-            resp = requests.patch(url_single, headers=headers, data=json.dumps(payload_single), timeout=timeout_seconds)
-            if resp.status_code == 401:
-                last_err = requests.HTTPError(f"401 Unauthorized (variant {hv})")
-                continue
-            resp.raise_for_status()
-            return resp.json() if resp.content else {}
-        except Exception as e:
-            last_err = e
-            continue
-
-    if last_err:
-        raise last_err
-    return {}
+    try:
+        log(f"PATCH {url_single} payload={json.dumps(payload_single)}", verbose)
+        resp = _SESSION.patch(url_single, headers=headers, data=orjson.dumps(payload_single), timeout=timeout_seconds)
+        resp.raise_for_status()
+        return orjson.loads(resp.content) if resp.content else {}
+    except Exception as e:
+        last_err = e
 
+    raise last_err
 
-def load_config(verbose: bool = False, require_voog: bool = True) -> SyncConfig:
-    load_dotenv()
+
+# .env is static for the process lifetime: parse it once at import and build
+# the SyncConfig once, handing out shallow copies for per-call overrides.
+load_dotenv()
+_BASE_CFG: Optional[SyncConfig] = None
+
+
+def _build_base_cfg() -> SyncConfig:
     erply_client_code = os.getenv("ERPLY_CLIENT_CODE", "").strip()
     erply_username = os.getenv("ERPLY_USERNAME", "").strip()
     erply_password = os.getenv("ERPLY_PASSWORD", "").strip()
@@ -290,34 +467,43 @@ def load_config(verbose: bool = False, require_voog: bool = True) -> SyncConfig:
     sum_all_warehouses_env = os.getenv("SUM_ALL_WAREHOUSES", "true").strip().lower()
     sum_all_warehouses = sum_all_warehouses_env in ("1", "true", "yes", "y")
 
+    return SyncConfig(
+        erply_client_code=erply_client_code,
+        erply_username=erply_username,
+        erply_password=erply_password,
+        voog_site=voog_site,
+        voog_api_token=voog_api_token,
+        erply_api_url=erply_api_url,
+        erply_warehouse_id=erply_warehouse_id,
+        sum_all_warehouses=sum_all_warehouses,
+    )
+
+
+def load_config(verbose: bool = False, require_voog: bool = True) -> SyncConfig:
+    global _BASE_CFG
+    if _BASE_CFG is None:
+        _BASE_CFG = _build_base_cfg()
+
     missing: List[str] = []
-    if not erply_client_code:
+    if not _BASE_CFG.erply_client_code:
         missing.append("ERPLY_CLIENT_CODE")
-    if not erply_username:
+    if not _BASE_CFG.erply_username:
         missing.append("ERPLY_USERNAME")
-    if not erply_password:
+    if not _BASE_CFG.erply_password:
         missing.append("ERPLY_PASSWORD")
     if require_voog:
-        if not voog_site:
+        if not _BASE_CFG.voog_site:
             missing.append("VOOG_SITE")
-        if not voog_api_token:
+        if not _BASE_CFG.voog_api_token:
             missing.append("VOOG_API_TOKEN")
     if missing:
         raise RuntimeError(
             "Missing required environment variables: " + ", ".join(missing)
         )
 
-    return SyncConfig(
-        erply_client_code=erply_client_code,
-        erply_username=erply_username,
-        erply_password=erply_password,
-        voog_site=voog_site,
-        voog_api_token=voog_api_token,
-        erply_api_url=erply_api_url,
-        erply_warehouse_id=erply_warehouse_id,
-        sum_all_warehouses=sum_all_warehouses,
-        verbose=verbose,
-    )
+    cfg = copy.copy(_BASE_CFG)
+    cfg.verbose = verbose
+    return cfg
 
 
 @app.command()
@@ -380,6 +566,10 @@ def sync(
             typer.echo("Dry-run: skipping Voog update")
             raise typer.Exit(code=0)
 
+        if _voog_stock_matches(voog_product, erply_stock_value):
+            typer.echo(f"Voog stock already {erply_stock_value}; skipping update")
+            raise typer.Exit(code=0)
+
         update_resp = voog_update_stock(
             cfg.voog_site,
             cfg.voog_api_token,
@@ -388,8 +578,15 @@ def sync(
             cfg.timeout_seconds,
             cfg.verbose,
         )
+        # The stored ETag no longer matches the product we just wrote
+        invalidate_voog_etag(cfg.voog_site, sku)
         typer.echo("Voog update response:")
         typer.echo(json.dumps(update_resp, ensure_ascii=False, indent=2))
+    except typer.Exit:
+        # typer.Exit subclasses RuntimeError; the intentional exits above
+        # (dry-run, no-op skip, not-found) must not fall into the handlers
+        # below and get reported as errors.
+        raise
     except requests.HTTPError as http_err:
         typer.secho(f"HTTP error: {http_err}", fg=typer.colors.RED)
         raise typer.Exit(code=1)
@@ -403,10 +600,20 @@ def erply_set_stock(
     sku: str = typer.Option(..., help="Product SKU"),
     stock: float = typer.Option(..., help="Target absolute stock quantity"),
     warehouse_id: Optional[int] = typer.Option(None, help="Warehouse ID; default picks active/first"),
+    expected_current: Optional[float] = typer.Option(
+        None, help="Known current stock; skips the Erply stock read (and all reads when already at target)"
+    ),
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Verbose logging"),
 ):
     """Set absolute stock for SKU in Erply by applying registration/write-off to reach target."""
     try:
+        # Fast path: the caller already knows current stock, so an idempotent
+        # re-run exits before spending any Erply round trips.
+        if expected_current is not None and abs(stock - expected_current) < 1e-9:
+            typer.echo(f"Current={expected_current}, target={stock}, delta=0.0")
+            typer.echo("No change needed")
+            raise typer.Exit(code=0)
+
         cfg = load_config(verbose=verbose, require_voog=False)
         if warehouse_id is not None:
             cfg.erply_warehouse_id = warehouse_id
@@ -416,8 +623,11 @@ def erply_set_stock(
             typer.secho(f"Erply product not found for SKU {sku}", fg=typer.colors.RED)
             raise typer.Exit(code=2)
         product_id = product_ids[0]
-        stock_map = erply_get_stock_for_products(cfg, session_key, [product_id])
-        current = sum(stock_map.values()) if stock_map else 0.0
+        if expected_current is not None:
+            current = expected_current
+        else:
+            stock_map = erply_get_stock_for_products(cfg, session_key, [product_id])
+            current = sum(stock_map.values()) if stock_map else 0.0
         delta = stock - current
         typer.echo(f"Current={current}, target={stock}, delta={delta}")
         if abs(delta) < 1e-9:
@@ -428,6 +638,10 @@ def erply_set_stock(
         else:
             erply_inventory_writeoff(cfg, session_key, product_id, abs(delta), cfg.erply_warehouse_id)
         typer.echo(json.dumps({"ok": True, "applied_delta": delta}, ensure_ascii=False))
+    except typer.Exit:
+        # Same as sync: the no-change fast path and not-found exits are
+        # intentional and must keep their exit codes.
+        raise
     except Exception as exc:
         typer.secho(f"Error: {exc}", fg=typer.colors.RED)
         raise typer.Exit(code=1)
@@ -439,16 +653,16 @@ def erply_save_product(cfg: SyncConfig, session_key: str, sku: str, name: str) -
     # Discover minimal required fields: groupID and vatRateID are often required
     group_id = erply_pick_default_group(cfg, session_key)
     vat_rate_id = erply_pick_default_vat_rate(cfg, session_key)
-    payload: Dict[str, Any] = {
-        "clientCode": cfg.erply_client_code,
-        "request": "saveProduct",
-        "sessionKey": session_key,
-        "name": name,
-        "code": sku,
-        "groupID": group_id,
-        "vatRateID": vat_rate_id,
-        "status": "ACTIVE",
-    }
+    payload = _erply_payload(
+        cfg,
+        session_key,
+        "saveProduct",
+        name=name,
+        code=sku,
+        groupID=group_id,
+        vatRateID=vat_rate_id,
+        status="ACTIVE",
+    )
     return erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
 
 
@@ -474,44 +688,304 @@ def erply_create_product(
 
 
 def erply_pick_default_group(cfg: SyncConfig, session_key: str) -> int:
-    payload = {
-        "clientCode": cfg.erply_client_code,
-        "request": "getProductGroups",
-        "sessionKey": session_key,
-    }
+    cached = _ref_cache_get("group", cfg.erply_client_code)
+    if cached is not None:
+        return cached
+    payload = _erply_payload(cfg, session_key, "getProductGroups")
     data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
     groups = data.get("records") or []
-    if not groups:
-        # Fallback to 1 as many accounts have a default group with ID 1
-        return 1
-    # Prefer an active group; otherwise first
-    for g in groups:
-        if g.get("active") in (True, 1, "1"):  # active flag may vary
-            gid = g.get("productGroupID") or g.get("id") or g.get("groupID")
-            if gid:
-                return int(gid)
-    gid = groups[0].get("productGroupID") or groups[0].get("id") or groups[0].get("groupID")
-    return int(gid or 1)
+    gid = None
+    if groups:
+        # Prefer an active group; otherwise first
+        for g in groups:
+            if g.get("active") in (True, 1, "1"):  # active flag may vary
+                gid = g.get("productGroupID") or g.get("id") or g.get("groupID")
+                if gid:
+                    break
+        if not gid:
+            gid = groups[0].get("productGroupID") or groups[0].get("id") or groups[0].get("groupID")
+    # Fallback to 1 as many accounts have a default group with ID 1
+    result = int(gid or 1)
+    _ref_cache_put("group", cfg.erply_client_code, result)
+    return result
 
 
 def erply_pick_default_vat_rate(cfg: SyncConfig, session_key: str) -> int:
-    payload = {
-        "clientCode": cfg.erply_client_code,
-        "request": "getVatRates",
-        "sessionKey": session_key,
-    }
+    cached = _ref_cache_get("vat_rate", cfg.erply_client_code)
+    if cached is not None:
+        return cached
+    payload = _erply_payload(cfg, session_key, "getVatRates")
     data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
     rates = data.get("records") or []
-    if not rates:
-        return 1
-    # Prefer isDefault or the highest rate named like standard
-    for r in rates:
-        if r.get("isDefault") in (True, 1, "1"):
-            rid = r.get("vatRateID") or r.get("id")
-            if rid:
-                return int(rid)
-    rid = rates[0].get("vatRateID") or rates[0].get("id")
-    return int(rid or 1)
+    rid = None
+    if rates:
+        # Prefer isDefault or the highest rate named like standard
+        for r in rates:
+            if r.get("isDefault") in (True, 1, "1"):
+                rid = r.get("vatRateID") or r.get("id")
+                if rid:
+                    break
+        if not rid:
+            rid = rates[0].get("vatRateID") or rates[0].get("id")
+    result = int(rid or 1)
+    _ref_cache_put("vat_rate", cfg.erply_client_code, result)
+    return result
+
+
+# ---- Async HTTP helpers for the webhook path ----
+
+class AsyncSyncClient:
+    """Holds one aiohttp session shared by all calls of a single webhook request."""
+
+    def __init__(self, timeout_seconds: int = 20) -> None:
+        self.timeout_seconds = timeout_seconds
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "AsyncSyncClient":
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=CONCURRENCY * 2, keepalive_timeout=30),
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            raise RuntimeError("AsyncSyncClient used outside of its context")
+        return self._session
+
+
+async def get_async_client():
+    async with AsyncSyncClient() as client:
+        yield client
+
+
+async def _erply_post(
+    session: aiohttp.ClientSession, url: str, payload: Dict[str, Any], verbose: bool = False
+) -> Dict[str, Any]:
+    headers = {"User-Agent": "voog-erply-sync/0.1"}
+    log(
+        f"POST {url} payload={json.dumps({k: v for k, v in payload.items() if k not in ['username', 'password', 'sessionKey']})}",
+        verbose,
+    )
+    async with session.post(url, data=payload, headers=headers) as resp:
+        resp.raise_for_status()
+        data = orjson.loads(await resp.read())
+    status = data.get("status", {})
+    error_code = status.get("errorCode")
+    if error_code not in (None, 0):
+        raise ErplyApiError(
+            f"Erply API error: code={error_code} msg={status.get('errorField') or status}",
+            error_code=error_code,
+        )
+    return data
+
+
+async def _erply_get_session_key(session: aiohttp.ClientSession, cfg: SyncConfig) -> str:
+    data = await _erply_post(session, cfg.erply_api_url, _verify_user_payload(cfg), cfg.verbose)
+    return _extract_session_key(data)
+
+
+async def _get_cached_session_key(session: aiohttp.ClientSession, cfg: SyncConfig) -> str:
+    cache_key = (cfg.erply_client_code, cfg.erply_username)
+    with _ERPLY_SESSION_LOCK:
+        entry = _ERPLY_SESSION_CACHE.get(cache_key)
+        if entry and time.time() < entry[1] - 60:
+            return entry[0]
+    session_key = await _erply_get_session_key(session, cfg)
+    with _ERPLY_SESSION_LOCK:
+        _ERPLY_SESSION_CACHE[cache_key] = (session_key, time.time() + _ERPLY_SESSION_TTL_SECONDS)
+    return session_key
+
+
+async def _erply_find_product_ids_by_sku(
+    session: aiohttp.ClientSession, cfg: SyncConfig, session_key: str, sku: str
+) -> List[int]:
+    payload = _erply_payload(cfg, session_key, "getProducts", code=sku)
+    data = await _erply_post(session, cfg.erply_api_url, payload, cfg.verbose)
+    return _product_ids_from_records(data.get("records") or [], sku)
+
+
+async def _erply_find_product_ids_by_skus(
+    session: aiohttp.ClientSession, cfg: SyncConfig, session_key: str, skus: List[str]
+) -> Dict[str, List[int]]:
+    """Resolve many SKUs with one getProducts call via the comma-separated codes filter."""
+    if not skus:
+        # codes="" would be an unfiltered catalog query; webhook payloads
+        # with no items must not trigger a full product dump.
+        return {}
+    payload = _erply_payload(cfg, session_key, "getProducts", codes=",".join(skus))
+    data = await _erply_post(session, cfg.erply_api_url, payload, cfg.verbose)
+    wanted = set(skus)
+    sku_to_pids: Dict[str, List[int]] = {}
+    for rec in data.get("records") or []:
+        product_id = rec.get("productID") or rec.get("id")
+        rec_code = rec.get("code") or rec.get("code2") or rec.get("code3")
+        if product_id and rec_code in wanted:
+            sku_to_pids.setdefault(rec_code, []).append(int(product_id))
+    return sku_to_pids
+
+
+async def _erply_get_stock_for_products(
+    session: aiohttp.ClientSession, cfg: SyncConfig, session_key: str, product_ids: List[int]
+) -> Dict[int, float]:
+    if not product_ids:
+        return {}
+    payload = _stock_payload(cfg, session_key, product_ids)
+    data = await _erply_post(session, cfg.erply_api_url, payload, cfg.verbose)
+    return _stock_map_from_records(cfg, data.get("records") or [])
+
+
+async def _voog_get_product(
+    session: aiohttp.ClientSession, voog_site: str, api_token: str, sku: str, verbose: bool = False
+) -> Optional[Dict[str, Any]]:
+    url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
+    params = {"q.product.sku.$eq": sku, "per_page": 50}
+    headers = {
+        "X-API-TOKEN": api_token,
+        "Accept": "application/json",
+        "User-Agent": "voog-erply-sync/0.1",
+    }
+    log(f"GET {url} params={params}", verbose)
+    async with session.get(url, headers=headers, params=params) as resp:
+        resp.raise_for_status()
+        items = orjson.loads(await resp.read())
+    if isinstance(items, list):
+        for it in items:
+            if it.get("sku") == sku:
+                return it
+    return None
+
+
+async def _voog_get_products_by_skus(
+    session: aiohttp.ClientSession, voog_site: str, api_token: str, skus: List[str], verbose: bool = False
+) -> Dict[str, Dict[str, Any]]:
+    """Resolve many SKUs in one go via the multi-value $in filter instead of per-SKU GETs."""
+    url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
+    headers = {
+        "X-API-TOKEN": api_token,
+        "Accept": "application/json",
+        "User-Agent": "voog-erply-sync/0.1",
+    }
+    wanted = set(skus)
+    per_page = 250
+    products_by_sku: Dict[str, Dict[str, Any]] = {}
+    # Keep the query string bounded: look up at most 200 SKUs per call
+    for start in range(0, len(skus), 200):
+        chunk = skus[start : start + 200]
+        page = 1
+        while True:
+            params = {"q.product.sku.$in": ",".join(chunk), "per_page": per_page, "page": page}
+            log(f"GET {url} params={params}", verbose)
+            async with session.get(url, headers=headers, params=params) as resp:
+                resp.raise_for_status()
+                items = orjson.loads(await resp.read())
+            if not isinstance(items, list):
+                break
+            for it in items:
+                if it.get("sku") in wanted:
+                    products_by_sku[it["sku"]] = it
+            if len(items) < per_page:
+                break
+            page += 1
+    return products_by_sku
+
+
+async def _voog_update(
+    session: aiohttp.ClientSession,
+    voog_site: str,
+    api_token: str,
+    product_id: int,
+    stock_value: float,
+    verbose: bool = False,
+) -> Dict[str, Any]:
+    url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
+    payload = {
+        "actions": [{"target_field": "stock", "action": "set", "value": stock_value}],
+        "target_ids": [product_id],
+    }
+    headers = {
+        "X-API-TOKEN": api_token,
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "User-Agent": "voog-erply-sync/0.1",
+    }
+    log(f"PUT {url} payload={json.dumps(payload)}", verbose)
+    async with session.put(url, headers=headers, data=orjson.dumps(payload)) as resp:
+        resp.raise_for_status()
+        body = await resp.read()
+    return orjson.loads(body) if body else {}
+
+
+async def _voog_patch_stock(
+    session: aiohttp.ClientSession,
+    voog_site: str,
+    api_token: str,
+    product_id: int,
+    stock_value: float,
+    verbose: bool = False,
+) -> None:
+    url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products/{product_id}"
+    headers = {
+        "X-API-TOKEN": api_token,
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "User-Agent": "voog-erply-sync/0.1",
+    }
+    payload = {"stock": stock_value}
+    log(f"PATCH {url} payload={json.dumps(payload)}", verbose)
+    async with session.patch(url, headers=headers, data=orjson.dumps(payload)) as resp:
+        resp.raise_for_status()
+
+
+async def _voog_bulk_set_stock(
+    session: aiohttp.ClientSession,
+    voog_site: str,
+    api_token: str,
+    updates: Dict[int, float],
+    verbose: bool = False,
+) -> None:
+    """Write many product stocks with as few bulk PUTs as products share a value.
+
+    The bulk endpoint takes one scalar value per action, so products are bucketed
+    by their target stock and each bucket goes out as a single PUT. A failing
+    bucket falls back to per-product PATCH so one bad ID cannot sink the rest.
+    """
+    url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
+    headers = {
+        "X-API-TOKEN": api_token,
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "User-Agent": "voog-erply-sync/0.1",
+    }
+    buckets: Dict[float, List[int]] = {}
+    for product_id, value in updates.items():
+        buckets.setdefault(value, []).append(product_id)
+
+    # Buckets are independent; send them concurrently but capped so a burst
+    # of distinct values does not trip Voog rate limits.
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def send_bucket(value: float, product_ids: List[int]) -> None:
+        payload = {
+            "actions": [{"target_field": "stock", "action": "set", "value": value}],
+            "target_ids": product_ids,
+        }
+        async with semaphore:
+            log(f"PUT {url} payload={json.dumps(payload)}", verbose)
+            try:
+                async with session.put(url, headers=headers, data=orjson.dumps(payload)) as resp:
+                    resp.raise_for_status()
+            except Exception:
+                for product_id in product_ids:
+                    await _voog_patch_stock(session, voog_site, api_token, product_id, value, verbose)
+
+    await asyncio.gather(*(send_bucket(value, pids) for value, pids in buckets.items()))
 
 
 # ---- Minimal webhook server for two-way POC ----
@@ -528,16 +1002,37 @@ class OrderWebhook(BaseModel):
 
 
 def create_api() -> FastAPI:
-    api = FastAPI(title="Erply↔Voog POC Webhooks")
+    api = FastAPI(title="Erply↔Voog POC Webhooks", default_response_class=ORJSONResponse)
+
+    # Build the config once per worker instead of re-reading env per request
+    verbose = os.getenv("SYNC_VERBOSE", "false").lower() in ("1", "true", "yes")
+    api.state.cfg = load_config(verbose=verbose)
+
+    def get_cfg(request: Request) -> SyncConfig:
+        # Shallow copy so per-request overrides never touch the shared config
+        return copy.copy(request.app.state.cfg)
 
     @api.get("/healthz")
     async def healthz():
         return {"ok": True}
 
+    @api.post("/admin/invalidate")
+    async def invalidate(kind: Optional[str] = None):
+        """Bump reference-cache versions after an Erply admin change (all kinds when none given)."""
+        if kind is not None and kind not in _REF_KINDS:
+            return {"ok": False, "error": f"Unknown kind {kind!r}; expected one of {list(_REF_KINDS)}"}
+        kinds = [kind] if kind else list(_REF_KINDS)
+        for k in kinds:
+            bump_reference_version(k)
+        return {"ok": True, "invalidated": kinds}
+
     @api.post("/voog/order-webhook")
-    async def voog_order_webhook(payload: OrderWebhook, request: Request):
-        verbose = os.getenv("SYNC_VERBOSE", "false").lower() in ("1", "true", "yes")
-        cfg = load_config(verbose=verbose)
+    async def voog_order_webhook(
+        payload: OrderWebhook,
+        request: Request,
+        client: AsyncSyncClient = Depends(get_async_client),
+        cfg: SyncConfig = Depends(get_cfg),
+    ):
         warehouse_override = payload.warehouse_id
         if warehouse_override:
             cfg.erply_warehouse_id = warehouse_override
@@ -547,9 +1042,9 @@ def create_api() -> FastAPI:
         write_strategy = os.getenv("ERPLY_WRITE_STRATEGY", "sync_only").lower()
 
         # Aggregate items by SKU
-        sku_to_qty: Dict[str, float] = {}
+        sku_to_qty: Dict[str, float] = defaultdict(float)
         for it in payload.items:
-            sku_to_qty[it.sku] = sku_to_qty.get(it.sku, 0.0) + float(it.quantity)
+            sku_to_qty[it.sku] += float(it.quantity)
 
         # Attempt to write to Erply if enabled (not implemented; requires exact API doc choices)
         applied: Dict[str, float] = {}
@@ -559,23 +1054,72 @@ def create_api() -> FastAPI:
                 log(f"[INTENT] Would decrement Erply stock for SKU {sku} by {qty} using strategy={write_strategy}", cfg.verbose)
                 applied[sku] = qty
 
-        # In all cases, trigger refresh from Erply to Voog for affected SKUs
+        # In all cases, trigger refresh from Erply to Voog for affected SKUs.
+        # The per-SKU pipelines are independent, so run them concurrently on one
+        # shared aiohttp session instead of serial blocking requests calls.
+        session = client.session
         refreshed: Dict[str, float] = {}
+        errors: Dict[str, str] = {}
+        skus = list(sku_to_qty.keys())
+
+        async def voog_phase() -> Dict[str, Dict[str, Any]]:
+            return await _voog_get_products_by_skus(
+                session, cfg.voog_site, cfg.voog_api_token, skus, cfg.verbose
+            )
+
+        async def erply_phase() -> Tuple[Dict[str, List[int]], Dict[int, float]]:
+            # Two Erply round trips total: one getProducts over all SKUs, one
+            # getProductStock over the union of their product IDs.
+            session_key = await _get_cached_session_key(session, cfg)
+
+            async def with_fresh_session(call):
+                # Re-login once if the cached session key has expired server-side
+                nonlocal session_key
+                try:
+                    return await call(session_key)
+                except ErplyApiError as exc:
+                    if not _is_expired_session_error(exc):
+                        raise
+                    invalidate_session_key(cfg)
+                    session_key = await _get_cached_session_key(session, cfg)
+                    return await call(session_key)
+
+            sku_to_pids = await with_fresh_session(
+                lambda key: _erply_find_product_ids_by_skus(session, cfg, key, skus)
+            )
+            all_pids = sorted({pid for pids in sku_to_pids.values() for pid in pids})
+            stock_map = await with_fresh_session(
+                lambda key: _erply_get_stock_for_products(session, cfg, key, all_pids)
+            )
+            return sku_to_pids, stock_map
+
+        # The Voog lookup and the Erply read pipeline hit different hosts and
+        # share no state, so overlap them instead of running back-to-back.
         try:
-            session_key = erply_get_session_key(cfg)
-            for sku in sku_to_qty.keys():
-                product_ids = erply_find_product_ids_by_sku(cfg, session_key, sku)
-                stock_map = erply_get_stock_for_products(cfg, session_key, product_ids)
-                erply_stock_value = sum(stock_map.values()) if stock_map else 0.0
-                voog_product = voog_get_product_by_sku(cfg.voog_site, cfg.voog_api_token, sku, cfg.timeout_seconds, cfg.verbose)
-                if voog_product:
-                    voog_update_stock(cfg.voog_site, cfg.voog_api_token, int(voog_product.get("id")), erply_stock_value, cfg.timeout_seconds, cfg.verbose)
-                refreshed[sku] = erply_stock_value
+            voog_products, (sku_to_pids, stock_map) = await asyncio.gather(voog_phase(), erply_phase())
         except Exception as exc:
             return {"ok": False, "error": str(exc)}
 
+        voog_updates: Dict[int, float] = {}
+        for sku in skus:
+            erply_stock_value = sum(stock_map.get(pid, 0.0) for pid in sku_to_pids.get(sku, []))
+            refreshed[sku] = erply_stock_value
+            voog_product = voog_products.get(sku)
+            # Steady-state webhooks often carry no actual stock change; skip those writes
+            if voog_product and not _voog_stock_matches(voog_product, erply_stock_value):
+                voog_updates[int(voog_product.get("id"))] = erply_stock_value
+
+        if voog_updates:
+            try:
+                await _voog_bulk_set_stock(
+                    session, cfg.voog_site, cfg.voog_api_token, voog_updates, cfg.verbose
+                )
+            except Exception as exc:
+                errors["_voog_update"] = str(exc)
+
         return {
-            "ok": True,
+            "ok": not errors,
+            "errors": errors,
             "order_id": payload.order_id,
             "write_enabled": write_enabled,
             "write_strategy": write_strategy,
@@ -592,7 +1136,16 @@ def serve(
     port: int = typer.Option(8089, help="Bind port"),
 ):
     """Run webhook listener for two-way POC."""
-    uvicorn.run(create_api(), host=host, port=port, log_level="info")
+    uvicorn.run(
+        "erply_voog_sync:create_api",
+        factory=True,
+        host=host,
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 2)),
+        log_level="info",
+    )
 
 
 if __name__ == "__main__":
@@ -1,14 +1,82 @@
+import asyncio
 import json
 import os
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import requests
+import httpx
 import typer
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json still works
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # optional; batch list fetches fall back to buffered parse
+    ijson = None
+
 
 app = typer.Typer(help="Erply ↔ Voog sync POC v2: stock, price, status two‑way; SKU/name Erply→Voog.")
 
+# Static pieces reused on every call, hoisted so the hot path allocates less.
+_USER_AGENT = "voog-erply-sync-v2/0.1"
+_SAFE_KEYS = frozenset({"password", "sessionKey"})
+# Proxies sometimes strip the default Accept-Encoding; ask for compression
+# explicitly so list responses stay small on the wire.
+_VOOG_HEADERS_GET = {"Accept": "application/json", "Accept-Encoding": "gzip, br"}
+_VOOG_HEADERS_JSON = {"Accept": "application/json", "Content-Type": "application/json"}
+
+
+def _json_loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+# One HTTP/2 AsyncClient per run serves both Erply and Voog: per-host
+# keep-alive pooling, stream multiplexing for the back-to-back Voog calls,
+# and async fan-out all come from the same transport. Created inside the
+# running loop and closed with it (async with) — pooled connections are
+# bound to the loop that created them, so a process-global client would
+# break on the second asyncio.run in the same process.
+def _client(cfg: "SyncConfig") -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=cfg.timeout_seconds,
+        limits=httpx.Limits(max_keepalive_connections=8, max_connections=16),
+        transport=httpx.AsyncHTTPTransport(retries=3, http2=True),
+        headers={"User-Agent": _USER_AGENT},
+    )
+
+
+_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+async def _a_send(client: httpx.AsyncClient, method: str, url: str, attempts: int = 3, **kwargs: Any) -> httpx.Response:
+    """Send a request, retrying transient statuses with exponential backoff.
+
+    The transport's retries only cover connect errors; this loop handles
+    429/5xx responses and honors Retry-After. Raises on other error statuses.
+    """
+    delay = 1.0
+    while True:
+        resp = await client.request(method, url, **kwargs)
+        if resp.status_code in _RETRY_STATUS and attempts > 1:
+            retry_after = resp.headers.get("Retry-After")
+            try:
+                wait = float(retry_after) if retry_after else delay
+            except ValueError:
+                wait = delay
+            await asyncio.sleep(wait)
+            delay *= 2
+            attempts -= 1
+            continue
+        resp.raise_for_status()
+        return resp
+
 
 class SyncConfig:
     def __init__(
@@ -36,9 +104,11 @@ class SyncConfig:
         self.verbose = verbose
 
 
-def log(message: str, verbose: bool) -> None:
+def log(verbose: bool, make_message: Callable[[], str]) -> None:
+    # Call sites hand over a lambda so the message (f-string, json.dumps,
+    # bytes decode) is only ever built when verbose output is on.
     if verbose:
-        typer.echo(message)
+        typer.echo(make_message())
 
 
 def load_config(verbose: bool = False) -> SyncConfig:
@@ -83,57 +153,174 @@ def load_config(verbose: bool = False) -> SyncConfig:
 
 # ---- Erply helpers ----
 
-def erply_api_request(url: str, payload: Dict[str, Any], timeout_seconds: int, verbose: bool) -> Dict[str, Any]:
-    headers = {"User-Agent": "voog-erply-sync-v2/0.1"}
-    safe_payload = {k: v for k, v in payload.items() if k not in {"password", "sessionKey"}}
-    log(f"POST {url} payload={json.dumps(safe_payload)}", verbose)
-    resp = requests.post(url, data=payload, headers=headers, timeout=timeout_seconds)
-    resp.raise_for_status()
-    data = resp.json()
+class ErplyApiError(RuntimeError):
+    """Erply API returned a non-zero errorCode (same shape as the v1 script's)."""
+
+    def __init__(self, message: str, error_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.error_code = error_code
+
+
+# Erply session keys stay valid for about an hour; persisting one across CLI
+# invocations makes a shell loop over many SKUs pay for verifyUser once.
+_SESSION_CACHE_PATH = os.path.expanduser("~/.cache/erply-voog-sync/session.json")
+_SESSION_SAFETY_MARGIN_SECONDS = 60
+# Erply error codes for an expired / invalid session key.
+_EXPIRED_SESSION_CODES = {1054, 1055}
+
+
+def _read_cached_session(client_code: str, username: str) -> Optional[str]:
+    try:
+        with open(_SESSION_CACHE_PATH, "rb") as fh:
+            cached = _json_loads(fh.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict):
+        return None
+    if cached.get("client_code") != client_code or cached.get("username") != username:
+        return None
+    try:
+        expires_at = float(cached.get("expires_at") or 0)
+    except (TypeError, ValueError):
+        return None
+    if time.time() >= expires_at - _SESSION_SAFETY_MARGIN_SECONDS:
+        return None
+    return cached.get("session_key") or None
+
+
+def _write_cached_session(client_code: str, username: str, session_key: str, expires_at: float) -> None:
+    # Best-effort: a read-only home directory should never break a sync.
+    try:
+        os.makedirs(os.path.dirname(_SESSION_CACHE_PATH), exist_ok=True)
+        tmp_path = _SESSION_CACHE_PATH + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(
+                _json_dumps(
+                    {
+                        "client_code": client_code,
+                        "username": username,
+                        "session_key": session_key,
+                        "expires_at": expires_at,
+                    }
+                )
+            )
+        os.replace(tmp_path, _SESSION_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def invalidate_session_cache() -> None:
+    try:
+        os.remove(_SESSION_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def _is_expired_session_error(exc: BaseException) -> bool:
+    if not isinstance(exc, ErplyApiError):
+        return False
+    try:
+        return int(exc.error_code) in _EXPIRED_SESSION_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def _session_key_from_verify(data: Dict[str, Any], cfg: SyncConfig) -> str:
+    recs = data.get("records") or []
+    key = None
+    session_length = 3600
+    if recs and isinstance(recs, list) and isinstance(recs[0], dict):
+        key = recs[0].get("sessionKey")
+        try:
+            session_length = int(recs[0].get("sessionLength") or 3600)
+        except (TypeError, ValueError):
+            session_length = 3600
+    if not key and "sessionKey" in data:
+        key = data["sessionKey"]
+    if not key:
+        raise RuntimeError("No Erply sessionKey")
+    _write_cached_session(cfg.erply_client_code, cfg.erply_username, key, time.time() + session_length)
+    return key
+
+
+# Warehouses rarely change; remember the pick per session so repeated writes
+# within one invocation cost one lookup.
+_WAREHOUSE_CACHE: Dict[Any, int] = {}
+
+
+# ---- API helpers (async) ----
+#
+# sync_fields has two independent read legs (Voog lookup vs Erply
+# verifyUser+getProducts) and, with direction=both, two independent write
+# legs. asyncio.gather overlaps those round trips, and the shared HTTP/2
+# client multiplexes the Voog calls on one TLS connection.
+
+async def a_erply_api_request(
+    client: httpx.AsyncClient, url: str, payload: Dict[str, Any], verbose: bool, attempts: int = 3
+) -> Dict[str, Any]:
+    log(verbose, lambda: f"POST {url} payload={json.dumps({k: v for k, v in payload.items() if k not in _SAFE_KEYS})}")
+    resp = await _a_send(client, "POST", url, attempts=attempts, data=payload)
+    data = _json_loads(resp.content)
     status = data.get("status", {})
     if status.get("errorCode") not in (None, 0):
-        raise RuntimeError(f"Erply API error: {status}")
+        raise ErplyApiError(f"Erply API error: {status}", error_code=status.get("errorCode"))
     return data
 
 
-def erply_get_session_key(cfg: SyncConfig) -> str:
+async def a_erply_get_session_key(client: httpx.AsyncClient, cfg: SyncConfig, use_cache: bool = True) -> str:
+    if use_cache:
+        cached = _read_cached_session(cfg.erply_client_code, cfg.erply_username)
+        if cached:
+            return cached
     payload = {
         "clientCode": cfg.erply_client_code,
         "request": "verifyUser",
         "username": cfg.erply_username,
         "password": cfg.erply_password,
     }
-    data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
-    recs = data.get("records") or []
-    if recs and isinstance(recs, list) and isinstance(recs[0], dict):
-        key = recs[0].get("sessionKey")
-        if key:
-            return key
-    if "sessionKey" in data:
-        return data["sessionKey"]
-    raise RuntimeError("No Erply sessionKey")
-
-
-def erply_find_product_by_sku(cfg: SyncConfig, session_key: str, sku: str) -> Optional[Dict[str, Any]]:
+    data = await a_erply_api_request(client, cfg.erply_api_url, payload, cfg.verbose)
+    return _session_key_from_verify(data, cfg)
+
+
+async def a_erply_bulk_request(
+    client: httpx.AsyncClient, cfg: SyncConfig, session_key: str, sub_requests: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    numbered: List[Dict[str, Any]] = []
+    for i, sub in enumerate(sub_requests):
+        sub = dict(sub)
+        sub.setdefault("requestID", str(i))
+        numbered.append(sub)
     payload = {
         "clientCode": cfg.erply_client_code,
-        "request": "getProducts",
         "sessionKey": session_key,
-        "code": sku,
+        "requests": _json_dumps(numbered).decode(),
     }
-    data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
-    recs = data.get("records") or []
-    return recs[0] if recs else None
-
-
-def erply_get_stock(cfg: SyncConfig, session_key: str, product_id: int) -> float:
+    log(cfg.verbose, lambda: f"POST {cfg.erply_api_url} bulk requests={payload['requests']}")
+    resp = await _a_send(client, "POST", cfg.erply_api_url, data=payload)
+    data = _json_loads(resp.content)
+    status = data.get("status", {})
+    if status.get("errorCode") not in (None, 0):
+        raise ErplyApiError(f"Erply API error: {status}", error_code=status.get("errorCode"))
+    responses = data.get("requests") or []
+    by_id = {str((r.get("status") or {}).get("requestID")): r for r in responses}
+    ordered = [by_id.get(sub["requestID"], {}) for sub in numbered]
+    for sub_resp in ordered:
+        sub_status = sub_resp.get("status") or {}
+        if sub_status.get("errorCode") not in (None, 0):
+            raise ErplyApiError(f"Erply API error: {sub_status}", error_code=sub_status.get("errorCode"))
+    return ordered
+
+
+async def a_erply_get_stock(client: httpx.AsyncClient, cfg: SyncConfig, session_key: str, product_id: int) -> float:
     payload = {
         "clientCode": cfg.erply_client_code,
         "request": "getProductStock",
         "sessionKey": session_key,
         "productIDs": str(product_id),
     }
-    data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
+    if cfg.erply_warehouse_id and not cfg.sum_all_warehouses:
+        payload["warehouseID"] = cfg.erply_warehouse_id
+    data = await a_erply_api_request(client, cfg.erply_api_url, payload, cfg.verbose)
     recs = data.get("records") or []
     if not recs:
         return 0.0
@@ -144,13 +331,65 @@ def erply_get_stock(cfg: SyncConfig, session_key: str, product_id: int) -> float
         return 0.0
 
 
-def erply_set_stock_absolute(cfg: SyncConfig, session_key: str, product_id: int, target: float) -> None:
-    current = erply_get_stock(cfg, session_key, product_id)
+async def a_erply_get_stock_map(
+    client: httpx.AsyncClient, cfg: SyncConfig, session_key: str, product_ids: List[int]
+) -> Dict[int, float]:
+    """One getProductStock over a CSV of product IDs, summed per product."""
+    if not product_ids:
+        return {}
+    payload = {
+        "clientCode": cfg.erply_client_code,
+        "request": "getProductStock",
+        "sessionKey": session_key,
+        "productIDs": ",".join(str(pid) for pid in product_ids),
+    }
+    if cfg.erply_warehouse_id and not cfg.sum_all_warehouses:
+        payload["warehouseID"] = cfg.erply_warehouse_id
+    data = await a_erply_api_request(client, cfg.erply_api_url, payload, cfg.verbose)
+    stock_map: Dict[int, float] = {}
+    for rec in data.get("records") or []:
+        pid = rec.get("productID")
+        if pid is None:
+            continue
+        amount = rec.get("amountInStock") or rec.get("free") or rec.get("amount")
+        try:
+            stock_map[int(pid)] = stock_map.get(int(pid), 0.0) + float(amount or 0)
+        except Exception:
+            continue
+    return stock_map
+
+
+async def a_get_default_warehouse(client: httpx.AsyncClient, cfg: SyncConfig, session_key: str) -> int:
+    cache_key = (cfg.erply_api_url, session_key)
+    if cache_key in _WAREHOUSE_CACHE:
+        return _WAREHOUSE_CACHE[cache_key]
+    payload = {
+        "clientCode": cfg.erply_client_code,
+        "request": "getWarehouses",
+        "sessionKey": session_key,
+    }
+    data = await a_erply_api_request(client, cfg.erply_api_url, payload, cfg.verbose)
+    recs = data.get("records") or []
+    wid = (recs[0].get("warehouseID") or recs[0].get("id")) if recs else None
+    result = int(wid or 1)
+    _WAREHOUSE_CACHE[cache_key] = result
+    return result
+
+
+async def a_erply_set_stock_absolute(
+    client: httpx.AsyncClient,
+    cfg: SyncConfig,
+    session_key: str,
+    product_id: int,
+    target: float,
+    current: Optional[float] = None,
+) -> None:
+    if current is None:
+        current = await a_erply_get_stock(client, cfg, session_key, product_id)
     delta = target - current
     if abs(delta) < 1e-9:
         return
-    # pick default warehouse
-    wid = get_default_warehouse(cfg, session_key)
+    wid = cfg.erply_warehouse_id or await a_get_default_warehouse(client, cfg, session_key)
     if delta > 0:
         payload = {
             "clientCode": cfg.erply_client_code,
@@ -170,24 +409,28 @@ def erply_set_stock_absolute(cfg: SyncConfig, session_key: str, product_id: int,
             "productID1": product_id,
             "amount1": abs(delta),
         }
-    erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
-
-
-def get_default_warehouse(cfg: SyncConfig, session_key: str) -> int:
-    payload = {
-        "clientCode": cfg.erply_client_code,
-        "request": "getWarehouses",
-        "sessionKey": session_key,
-    }
-    data = erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
-    recs = data.get("records") or []
-    if not recs:
-        return 1
-    wid = recs[0].get("warehouseID") or recs[0].get("id")
-    return int(wid or 1)
-
-
-def erply_update_product_fields(cfg: SyncConfig, session_key: str, product_id: int, *, price: Optional[float] = None, status_live: Optional[bool] = None) -> None:
+    try:
+        # attempts=1: a 5xx after Erply applied the registration/write-off
+        # must not be retried — the retry would apply the delta twice. The
+        # read-back guard below decides whether the write actually landed.
+        await a_erply_api_request(client, cfg.erply_api_url, payload, cfg.verbose, attempts=1)
+    except Exception:
+        # Same idempotency guard as the sync variant.
+        after = await a_erply_get_stock(client, cfg, session_key, product_id)
+        if abs(after - target) < 1e-9:
+            return
+        raise
+
+
+async def a_erply_update_product_fields(
+    client: httpx.AsyncClient,
+    cfg: SyncConfig,
+    session_key: str,
+    product_id: int,
+    *,
+    price: Optional[float] = None,
+    status_live: Optional[bool] = None,
+) -> None:
     payload: Dict[str, Any] = {
         "clientCode": cfg.erply_client_code,
         "request": "saveProduct",
@@ -198,19 +441,85 @@ def erply_update_product_fields(cfg: SyncConfig, session_key: str, product_id: i
         payload["price"] = price
     if status_live is not None:
         payload["status"] = "ACTIVE" if status_live else "INACTIVE"
-    erply_api_request(cfg.erply_api_url, payload, cfg.timeout_seconds, cfg.verbose)
-
-
-# ---- Voog helpers ----
-
-def voog_get_product_by_sku(voog_site: str, api_token: str, sku: str, timeout_seconds: int, verbose: bool) -> Optional[Dict[str, Any]]:
+    await a_erply_api_request(client, cfg.erply_api_url, payload, cfg.verbose)
+
+
+async def _voog_stream_page(
+    client: "httpx.AsyncClient",
+    url: str,
+    headers: Dict[str, str],
+    params: Dict[str, Any],
+    remaining: set,
+    by_sku: Dict[str, Dict[str, Any]],
+) -> int:
+    """Stream one list page with ijson, stopping as soon as every wanted SKU
+    is matched instead of parsing the rest of the body. Returns the number of
+    items seen (for pagination)."""
+    seen = 0
+    async with client.stream("GET", url, headers=headers, params=params) as resp:
+        resp.raise_for_status()
+        items = ijson.sendable_list()
+        coro = ijson.items_coro(items, "item")
+        async for data in resp.aiter_bytes():
+            try:
+                coro.send(data)
+            except StopIteration:
+                pass
+            for it in items:
+                seen += 1
+                item_sku = it.get("sku")
+                if item_sku in remaining:
+                    by_sku[item_sku] = it
+                    remaining.discard(item_sku)
+            del items[:]
+            if not remaining:
+                return seen
+        try:
+            coro.close()
+        except Exception:
+            pass
+    return seen
+
+
+async def a_voog_get_products_by_skus(
+    client: "httpx.AsyncClient", voog_site: str, api_token: str, skus: List[str], verbose: bool
+) -> Dict[str, Dict[str, Any]]:
+    """Resolve many SKUs with $in list queries instead of one GET per SKU."""
+    url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
+    headers = {"X-API-TOKEN": api_token, **_VOOG_HEADERS_GET}
+    by_sku: Dict[str, Dict[str, Any]] = {}
+    for start in range(0, len(skus), 200):
+        chunk = skus[start : start + 200]
+        remaining = set(chunk)
+        page = 1
+        while remaining:
+            params = {"q.product.sku.$in": ",".join(chunk), "per_page": 250, "page": page}
+            log(verbose, lambda: f"GET {url} params={params}")
+            if ijson is not None:
+                seen = await _voog_stream_page(client, url, headers, params, remaining, by_sku)
+            else:
+                resp = await _a_send(client, "GET", url, headers=headers, params=params)
+                items = _json_loads(resp.content)
+                seen = 0
+                if isinstance(items, list):
+                    for it in items:
+                        seen += 1
+                        if it.get("sku") in remaining:
+                            by_sku[it["sku"]] = it
+                            remaining.discard(it["sku"])
+            if seen < 250:
+                break
+            page += 1
+    return by_sku
+
+
+async def a_voog_get_product_by_sku(client: httpx.AsyncClient, voog_site: str, api_token: str, sku: str, verbose: bool) -> Optional[Dict[str, Any]]:
     url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
-    params = {"q.product.sku.$eq": sku, "per_page": 50}
-    headers = {"X-API-TOKEN": api_token, "Accept": "application/json", "User-Agent": "voog-erply-sync-v2/0.1"}
-    log(f"GET {url} params={params}", verbose)
-    resp = requests.get(url, headers=headers, params=params, timeout=timeout_seconds)
-    resp.raise_for_status()
-    items = resp.json()
+    params = {"q.product.sku.$eq": sku, "per_page": 250}
+    headers = {"X-API-TOKEN": api_token, **_VOOG_HEADERS_GET}
+    log(verbose, lambda: f"GET {url} params={params}")
+    resp = await _a_send(client, "GET", url, headers=headers, params=params)
+    items = _json_loads(resp.content)
     if isinstance(items, list):
         for it in items:
             if it.get("sku") == sku:
@@ -218,23 +527,78 @@ def voog_get_product_by_sku(voog_site: str, api_token: str, sku: str, timeout_se
     return None
 
 
-def voog_bulk_update(voog_site: str, api_token: str, product_ids: List[int], actions: List[Dict[str, Any]], timeout_seconds: int, verbose: bool) -> Dict[str, Any]:
+async def a_voog_bulk_update(
+    client: httpx.AsyncClient, voog_site: str, api_token: str, product_ids: List[int], actions: List[Dict[str, Any]], verbose: bool
+) -> Dict[str, Any]:
     url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products"
-    headers = {"X-API-TOKEN": api_token, "Accept": "application/json", "Content-Type": "application/json", "User-Agent": "voog-erply-sync-v2/0.1"}
+    headers = {"X-API-TOKEN": api_token, **_VOOG_HEADERS_JSON}
     payload = {"actions": actions, "target_ids": product_ids}
-    log(f"PUT {url} payload={json.dumps(payload)}", verbose)
-    resp = requests.put(url, headers=headers, data=json.dumps(payload), timeout=timeout_seconds)
-    resp.raise_for_status()
-    return resp.json() if resp.content else {}
+    body = _json_dumps(payload)
+    log(verbose, lambda: f"PUT {url} payload={body.decode()}")
+    resp = await _a_send(client, "PUT", url, headers=headers, content=body)
+    return _json_loads(resp.content) if resp.content else {}
 
 
-def voog_update_product_fields(voog_site: str, api_token: str, product_id: int, fields: Dict[str, Any], timeout_seconds: int, verbose: bool) -> Dict[str, Any]:
+async def a_voog_update_product_fields(
+    client: httpx.AsyncClient, voog_site: str, api_token: str, product_id: int, fields: Dict[str, Any], verbose: bool
+) -> Dict[str, Any]:
     url = f"https://{voog_site}.voog.com/admin/api/ecommerce/v1/products/{product_id}"
-    headers = {"X-API-TOKEN": api_token, "Accept": "application/json", "Content-Type": "application/json", "User-Agent": "voog-erply-sync-v2/0.1"}
-    log(f"PUT {url} payload={json.dumps(fields)}", verbose)
-    resp = requests.put(url, headers=headers, data=json.dumps(fields), timeout=timeout_seconds)
-    resp.raise_for_status()
-    return resp.json() if resp.content else {}
+    headers = {"X-API-TOKEN": api_token, **_VOOG_HEADERS_JSON}
+    body = _json_dumps(fields)
+    log(verbose, lambda: f"PUT {url} payload={body.decode()}")
+    resp = await _a_send(client, "PUT", url, headers=headers, content=body)
+    return _json_loads(resp.content) if resp.content else {}
+
+
+# Product records barely change within one process lifetime; repeated syncs
+# of the same SKU set pay each resolver round trip once (see --no-cache).
+# Keyed off the remote identity so different sites/accounts never collide.
+_VOOG_LOOKUP_CACHE: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+_ERPLY_LOOKUP_CACHE: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+
+
+async def voog_get_product_by_sku(
+    client: httpx.AsyncClient, voog_site: str, api_token: str, sku: str, verbose: bool
+) -> Optional[Dict[str, Any]]:
+    key = (voog_site, sku)
+    if key not in _VOOG_LOOKUP_CACHE:
+        _VOOG_LOOKUP_CACHE[key] = await a_voog_get_product_by_sku(client, voog_site, api_token, sku, verbose)
+    return _VOOG_LOOKUP_CACHE[key]
+
+
+async def erply_find_product_by_sku(
+    client: httpx.AsyncClient, cfg: SyncConfig, session_key: str, sku: str
+) -> Optional[Dict[str, Any]]:
+    key = (cfg.erply_api_url, sku)
+    if key not in _ERPLY_LOOKUP_CACHE:
+        payload = {
+            "clientCode": cfg.erply_client_code,
+            "request": "getProducts",
+            "sessionKey": session_key,
+            "code": sku,
+        }
+        data = await a_erply_api_request(client, cfg.erply_api_url, payload, cfg.verbose)
+        recs = data.get("records") or []
+        _ERPLY_LOOKUP_CACHE[key] = recs[0] if recs else None
+    return _ERPLY_LOOKUP_CACHE[key]
+
+
+def invalidate_voog_lookup(voog_site: str, sku: str) -> None:
+    """Drop one cached Voog record after writing the product — the cached
+    updated_at would read as a conflict on the next in-process sync."""
+    _VOOG_LOOKUP_CACHE.pop((voog_site, sku), None)
+
+
+def invalidate_erply_lookup(cfg: SyncConfig, sku: str) -> None:
+    """Drop one cached Erply record after writing the product."""
+    _ERPLY_LOOKUP_CACHE.pop((cfg.erply_api_url, sku), None)
+
+
+def reset_caches() -> None:
+    """Drop all in-process lookup caches (product resolvers + warehouse pick)."""
+    _VOOG_LOOKUP_CACHE.clear()
+    _ERPLY_LOOKUP_CACHE.clear()
+    _WAREHOUSE_CACHE.clear()
 
 
 # ---- CLI: sync fields ----
@@ -247,64 +611,313 @@ def sync_fields(
     include_price: bool = typer.Option(True, help="Sync price"),
     include_status: bool = typer.Option(True, help="Sync status"),
     include_sku_name: bool = typer.Option(True, help="Sync SKU+name Erply→Voog"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Drop in-process lookup caches before syncing"),
+    force: bool = typer.Option(False, "--force", help="Write even when both sides already agree"),
     verbose: bool = typer.Option(False, "--verbose", "-v"),
 ):
     cfg = load_config(verbose=verbose)
-    # Resolve resources
-    voog_product = voog_get_product_by_sku(cfg.voog_site, cfg.voog_api_token, sku, cfg.timeout_seconds, cfg.verbose)
-    if not voog_product:
-        typer.secho(f"Voog product with SKU {sku} not found", fg=typer.colors.RED)
+    if no_cache:
+        reset_caches()
+    asyncio.run(
+        _sync_fields_async(cfg, sku, direction, include_stock, include_price, include_status, include_sku_name, force)
+    )
+
+
+async def _erply_read_phase(
+    client: httpx.AsyncClient, cfg: SyncConfig, sku: str, include_stock: bool
+) -> Tuple[str, Optional[Dict[str, Any]], Optional[float]]:
+    session_key = await a_erply_get_session_key(client, cfg)
+    # One bulk POST fetches the product and the warehouses together; the
+    # warehouse answer pre-warms the cache for the write phase.
+    sub_requests = [
+        {"requestName": "getProducts", "code": sku},
+        {"requestName": "getWarehouses"},
+    ]
+    try:
+        product_resp, warehouse_resp = await a_erply_bulk_request(client, cfg, session_key, sub_requests)
+    except ErplyApiError as exc:
+        if not _is_expired_session_error(exc):
+            raise
+        # Cached key died early: drop it and re-login once.
+        invalidate_session_cache()
+        session_key = await a_erply_get_session_key(client, cfg, use_cache=False)
+        product_resp, warehouse_resp = await a_erply_bulk_request(client, cfg, session_key, sub_requests)
+    product_recs = product_resp.get("records") or []
+    erply_product = product_recs[0] if product_recs else None
+    warehouse_recs = warehouse_resp.get("records") or []
+    if warehouse_recs:
+        wid = warehouse_recs[0].get("warehouseID") or warehouse_recs[0].get("id")
+        if wid:
+            _WAREHOUSE_CACHE[(cfg.erply_api_url, session_key)] = int(wid)
+    erply_stock: Optional[float] = None
+    if include_stock and erply_product:
+        erply_id = int(erply_product.get("productID") or erply_product.get("id"))
+        erply_stock = await a_erply_get_stock(client, cfg, session_key, erply_id)
+    return session_key, erply_product, erply_stock
+
+
+async def _sync_fields_async(
+    cfg: SyncConfig,
+    sku: str,
+    direction: str,
+    include_stock: bool,
+    include_price: bool,
+    include_status: bool,
+    include_sku_name: bool,
+    force: bool = False,
+) -> None:
+    async with _client(cfg) as client:
+        # The Voog lookup and the Erply session+product+stock reads are
+        # independent; run both legs at once.
+        voog_product, (session_key, erply_product, erply_stock) = await asyncio.gather(
+            voog_get_product_by_sku(client, cfg.voog_site, cfg.voog_api_token, sku, cfg.verbose),
+            _erply_read_phase(client, cfg, sku, include_stock),
+        )
+        if not voog_product:
+            typer.secho(f"Voog product with SKU {sku} not found", fg=typer.colors.RED)
+            raise typer.Exit(code=2)
+        voog_id = int(voog_product["id"])
+        if not erply_product:
+            typer.secho(f"Erply product with SKU {sku} not found", fg=typer.colors.RED)
+            raise typer.Exit(code=3)
+        erply_id = int(erply_product.get("productID") or erply_product.get("id"))
+        # Versions as of our read; writes re-check these so a concurrent edit
+        # on the target side is surfaced instead of silently overwritten
+        # (last-write-wins would eat it).
+        voog_updated_at = voog_product.get("updated_at")
+        erply_last_modified = erply_product.get("lastModified")
+
+        # Gather values
+        if not include_stock:
+            erply_stock = None
+        erply_price = float(erply_product.get("price") or 0) if include_price else None
+        erply_status_live = None
+        if include_status:
+            st = (erply_product.get("status") or erply_product.get("active") or "ACTIVE")
+            erply_status_live = True if str(st).upper() in ("ACTIVE", "1", "TRUE") else False
+        erply_name = erply_product.get("name") if include_sku_name else None
+
+        voog_stock = int(voog_product.get("stock") or 0) if include_stock else None
+        voog_price = float(voog_product.get("price") or 0) if include_price else None
+        voog_status_live = (voog_product.get("status") == "live") if include_status else None
+        voog_name = voog_product.get("name")
+
+        # Apply: the two directions touch different systems, so with
+        # direction=both they run concurrently too.
+        async def erply_to_voog() -> None:
+            # Only changed fields go into actions — the steady-state case of
+            # both sides agreeing costs zero write round trips.
+            actions: List[Dict[str, Any]] = []
+            if include_stock and erply_stock is not None and (force or int(erply_stock) != (voog_stock or 0)):
+                actions.append({"target_field": "stock", "action": "set", "value": erply_stock})
+            if include_price and erply_price is not None and (force or abs(erply_price - (voog_price or 0)) > 1e-6):
+                actions.append({"target_field": "price", "action": "set", "value": erply_price})
+            if include_status and erply_status_live is not None and (force or erply_status_live != voog_status_live):
+                actions.append({"target_field": "status", "action": "set", "value": "live" if erply_status_live else "draft"})
+            # Name rides the same bulk PUT as the other fields; no separate
+            # per-product request. SKU stays same by key — if it ever needs
+            # writing, add a target_field="sku" action here.
+            if include_sku_name and erply_name and (force or erply_name != voog_name):
+                actions.append({"target_field": "name", "action": "set", "value": erply_name})
+            if actions:
+                fresh = await a_voog_get_product_by_sku(client, cfg.voog_site, cfg.voog_api_token, sku, cfg.verbose)
+                fresh_stamp = fresh.get("updated_at") if fresh else None
+                if voog_updated_at and fresh_stamp and fresh_stamp != voog_updated_at:
+                    typer.secho(
+                        f"Conflict: Voog product {sku} changed since read "
+                        f"({voog_updated_at} -> {fresh_stamp}); skipping Voog writes",
+                        fg=typer.colors.YELLOW,
+                        err=True,
+                    )
+                    return
+                await a_voog_bulk_update(client, cfg.voog_site, cfg.voog_api_token, [voog_id], actions, cfg.verbose)
+                # The cached record now lags our own write (same idea as v1's
+                # invalidate_voog_etag): drop it so the next sync re-reads
+                # instead of mistaking the new updated_at for a concurrent edit.
+                invalidate_voog_lookup(cfg.voog_site, sku)
+
+        async def voog_to_erply() -> None:
+            wants_write = (
+                (include_stock and voog_stock is not None)
+                or (include_price and voog_price is not None)
+                or (include_status and voog_status_live is not None)
+            )
+            if not wants_write:
+                return
+            (fresh_resp,) = await a_erply_bulk_request(
+                client, cfg, session_key, [{"requestName": "getProducts", "code": sku}]
+            )
+            fresh_recs = fresh_resp.get("records") or []
+            fresh_stamp = fresh_recs[0].get("lastModified") if fresh_recs else None
+            if erply_last_modified and fresh_stamp and str(fresh_stamp) != str(erply_last_modified):
+                typer.secho(
+                    f"Conflict: Erply product {sku} changed since read "
+                    f"({erply_last_modified} -> {fresh_stamp}); skipping Erply writes",
+                    fg=typer.colors.YELLOW,
+                    err=True,
+                )
+                return
+            if include_stock and voog_stock is not None:
+                await a_erply_set_stock_absolute(client, cfg, session_key, erply_id, float(voog_stock), current=erply_stock)
+            if include_price and voog_price is not None and (
+                force or erply_price is None or abs(voog_price - erply_price) > 1e-6
+            ):
+                await a_erply_update_product_fields(client, cfg, session_key, erply_id, price=float(voog_price))
+            if include_status and voog_status_live is not None and (
+                force or voog_status_live != erply_status_live
+            ):
+                await a_erply_update_product_fields(client, cfg, session_key, erply_id, status_live=bool(voog_status_live))
+            # Our writes changed the Erply record; drop the cached copy so the
+            # next in-process sync diffs against fresh values.
+            invalidate_erply_lookup(cfg, sku)
+
+        writers = []
+        if direction in ("erply-to-voog", "both"):
+            writers.append(erply_to_voog())
+        if direction in ("voog-to-erply", "both"):
+            writers.append(voog_to_erply())
+        if writers:
+            await asyncio.gather(*writers)
+
+        typer.echo("Sync complete")
+
+
+# ---- CLI: batch sync ----
+
+def _parse_skus(skus: str) -> List[str]:
+    """Accept a comma-separated list or a path to a file with one SKU per line."""
+    if os.path.isfile(skus):
+        with open(skus) as fh:
+            raw = [line.strip() for line in fh]
+    else:
+        raw = [part.strip() for part in skus.split(",")]
+    seen: Dict[str, None] = {}
+    for sku in raw:
+        if sku:
+            seen.setdefault(sku, None)
+    return list(seen)
+
+
+async def _erply_batch_read_phase(
+    client: httpx.AsyncClient, cfg: SyncConfig, skus: List[str], include_stock: bool
+) -> Tuple[str, Dict[str, Dict[str, Any]], Dict[int, float]]:
+    session_key = await a_erply_get_session_key(client, cfg)
+    # getProducts takes the whole SKU list as codes=..., so the batch costs
+    # the same two POSTs as a single-SKU sync.
+    sub_requests = [
+        {"requestName": "getProducts", "codes": ",".join(skus)},
+        {"requestName": "getWarehouses"},
+    ]
+    try:
+        product_resp, warehouse_resp = await a_erply_bulk_request(client, cfg, session_key, sub_requests)
+    except ErplyApiError as exc:
+        if not _is_expired_session_error(exc):
+            raise
+        invalidate_session_cache()
+        session_key = await a_erply_get_session_key(client, cfg, use_cache=False)
+        product_resp, warehouse_resp = await a_erply_bulk_request(client, cfg, session_key, sub_requests)
+    erply_by_sku: Dict[str, Dict[str, Any]] = {}
+    for rec in product_resp.get("records") or []:
+        code = rec.get("code")
+        if code:
+            erply_by_sku[code] = rec
+    warehouse_recs = warehouse_resp.get("records") or []
+    if warehouse_recs:
+        wid = warehouse_recs[0].get("warehouseID") or warehouse_recs[0].get("id")
+        if wid:
+            _WAREHOUSE_CACHE[(cfg.erply_api_url, session_key)] = int(wid)
+    stock_map: Dict[int, float] = {}
+    if include_stock:
+        pids = [
+            int(rec.get("productID") or rec.get("id"))
+            for rec in erply_by_sku.values()
+            if rec.get("productID") or rec.get("id")
+        ]
+        stock_map = await a_erply_get_stock_map(client, cfg, session_key, pids)
+    return session_key, erply_by_sku, stock_map
+
+
+async def _sync_fields_batch_async(
+    cfg: SyncConfig,
+    skus: List[str],
+    include_stock: bool,
+    include_price: bool,
+    include_status: bool,
+    include_sku_name: bool,
+) -> None:
+    async with _client(cfg) as client:
+        voog_by_sku, (session_key, erply_by_sku, stock_map) = await asyncio.gather(
+            a_voog_get_products_by_skus(client, cfg.voog_site, cfg.voog_api_token, skus, cfg.verbose),
+            _erply_batch_read_phase(client, cfg, skus, include_stock),
+        )
+
+        # Bucket by (field, value): products sharing a target value ride one
+        # bulk PUT via target_ids, so N products cost one request per
+        # distinct value rather than one per product.
+        buckets: Dict[Tuple[str, Any], List[int]] = {}
+        missing: List[str] = []
+        synced = 0
+        for sku in skus:
+            voog_product = voog_by_sku.get(sku)
+            erply_product = erply_by_sku.get(sku)
+            if not voog_product or not erply_product:
+                missing.append(sku)
+                continue
+            voog_id = int(voog_product["id"])
+            erply_id = int(erply_product.get("productID") or erply_product.get("id"))
+            if include_stock:
+                buckets.setdefault(("stock", stock_map.get(erply_id, 0.0)), []).append(voog_id)
+            if include_price:
+                buckets.setdefault(("price", float(erply_product.get("price") or 0)), []).append(voog_id)
+            if include_status:
+                st = (erply_product.get("status") or erply_product.get("active") or "ACTIVE")
+                live = str(st).upper() in ("ACTIVE", "1", "TRUE")
+                buckets.setdefault(("status", "live" if live else "draft"), []).append(voog_id)
+            if include_sku_name and erply_product.get("name"):
+                buckets.setdefault(("name", erply_product["name"]), []).append(voog_id)
+            synced += 1
+
+        await asyncio.gather(
+            *(
+                a_voog_bulk_update(
+                    client,
+                    cfg.voog_site,
+                    cfg.voog_api_token,
+                    ids,
+                    [{"target_field": field, "action": "set", "value": value}],
+                    cfg.verbose,
+                )
+                for (field, value), ids in buckets.items()
+            )
+        )
+        # The bulk writes bypass the single-SKU resolver cache but change the
+        # records it may hold from earlier sync-fields calls.
+        for sku in voog_by_sku:
+            invalidate_voog_lookup(cfg.voog_site, sku)
+
+        typer.echo(f"Synced {synced} SKUs ({len(buckets)} bulk updates)")
+        if missing:
+            typer.secho("Skipped (not found on both sides): " + ", ".join(missing), fg=typer.colors.YELLOW)
+
+
+@app.command()
+def sync_fields_batch(
+    skus: str = typer.Option(..., help="Comma-separated SKUs, or a file with one SKU per line"),
+    include_stock: bool = typer.Option(True, help="Sync stock"),
+    include_price: bool = typer.Option(True, help="Sync price"),
+    include_status: bool = typer.Option(True, help="Sync status"),
+    include_sku_name: bool = typer.Option(True, help="Sync name Erply→Voog"),
+    verbose: bool = typer.Option(False, "--verbose", "-v"),
+):
+    """Erply → Voog for many SKUs: one Voog list call, one Erply bulk, grouped updates."""
+    cfg = load_config(verbose=verbose)
+    sku_list = _parse_skus(skus)
+    if not sku_list:
+        typer.secho("No SKUs given", fg=typer.colors.RED)
         raise typer.Exit(code=2)
-    voog_id = int(voog_product["id"]) 
-
-    session_key = erply_get_session_key(cfg)
-    erply_product = erply_find_product_by_sku(cfg, session_key, sku)
-    if not erply_product:
-        typer.secho(f"Erply product with SKU {sku} not found", fg=typer.colors.RED)
-        raise typer.Exit(code=3)
-    erply_id = int(erply_product.get("productID") or erply_product.get("id"))
-
-    # Gather values
-    erply_stock = erply_get_stock(cfg, session_key, erply_id) if include_stock else None
-    erply_price = float(erply_product.get("price") or 0) if include_price else None
-    erply_status_live = None
-    if include_status:
-        st = (erply_product.get("status") or erply_product.get("active") or "ACTIVE")
-        erply_status_live = True if str(st).upper() in ("ACTIVE", "1", "TRUE") else False
-    erply_name = erply_product.get("name") if include_sku_name else None
-
-    voog_stock = int(voog_product.get("stock") or 0) if include_stock else None
-    voog_price = float(voog_product.get("price") or 0) if include_price else None
-    voog_status_live = (voog_product.get("status") == "live") if include_status else None
-
-    # Apply
-    if direction in ("erply-to-voog", "both"):
-        actions: List[Dict[str, Any]] = []
-        if include_stock and erply_stock is not None:
-            actions.append({"target_field": "stock", "action": "set", "value": erply_stock})
-        if include_price and erply_price is not None:
-            actions.append({"target_field": "price", "action": "set", "value": erply_price})
-        if include_status and erply_status_live is not None:
-            actions.append({"target_field": "status", "action": "set", "value": "live" if erply_status_live else "draft"})
-        if actions:
-            voog_bulk_update(cfg.voog_site, cfg.voog_api_token, [voog_id], actions, cfg.timeout_seconds, cfg.verbose)
-        if include_sku_name:
-            fields: Dict[str, Any] = {}
-            if erply_name:
-                fields["name"] = erply_name
-            # SKU stays same by key; optional write for alignment
-            if fields:
-                voog_update_product_fields(cfg.voog_site, cfg.voog_api_token, voog_id, fields, cfg.timeout_seconds, cfg.verbose)
-
-    if direction in ("voog-to-erply", "both"):
-        if include_stock and voog_stock is not None:
-            erply_set_stock_absolute(cfg, session_key, erply_id, float(voog_stock))
-        if include_price and voog_price is not None:
-            erply_update_product_fields(cfg, session_key, erply_id, price=float(voog_price))
-        if include_status and voog_status_live is not None:
-            erply_update_product_fields(cfg, session_key, erply_id, status_live=bool(voog_status_live))
-
-    typer.echo("Sync complete")
+    asyncio.run(
+        _sync_fields_batch_async(cfg, sku_list, include_stock, include_price, include_status, include_sku_name)
+    )
 
 
 if __name__ == "__main__":